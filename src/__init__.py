@@ -1,2 +1,3 @@
 from .builderTool import BaseBuilder
 from .virtualEnv import Venv, NULL_TARGET
+from .fileSet import FileSet
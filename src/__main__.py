@@ -1,9 +1,12 @@
-import os
+import os, sys
 import importlib.util
 import importlib
 from pathlib import Path
 
+from gamuLogger import Logger, LEVELS
+
 from .__init__ import BaseBuilder
+from .workspace import Workspace, WorkspaceError
 
 def loadPackFile(filePath) -> Path:
     """
@@ -18,9 +21,31 @@ def loadPackFile(filePath) -> Path:
     spec.loader.exec_module(pack)
     return Path(packFile)
 
+def runWorkspace(args : dict[str, any]) -> None:
+    """
+    Build all the packages of a workspace, each one in its own feanor process
+    Exit with an error code if one of them failed
+    """
+    if args["debug"]:
+        Logger.setLevel('stdout', LEVELS.DEBUG)
+    elif args["deep_debug"]:
+        Logger.setLevel('stdout', LEVELS.DEEP_DEBUG)
+
+    try:
+        hasSucceeded = Workspace(args["workspace"], os.path.basename(args["build-file"]), args).run()
+    except WorkspaceError as e:
+        Logger.critical(str(e))
+        sys.exit(1)
+    if not hasSucceeded:
+        Logger.critical('A package has failed')
+        sys.exit(1)
+
 def main() -> None:
     argumentParser = BaseBuilder.config_args()
     args = BaseBuilder.pre_parse_args(argumentParser)
+    if args.workspace is not None:
+        runWorkspace(vars(args))
+        return
     pathsBase = loadPackFile(vars(args)['build-file'])
     BaseBuilder.execute(argumentParser, pathsBase.parent)
     
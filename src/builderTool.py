@@ -1,5 +1,5 @@
 import argparse
-import os, sys, shutil
+import os, sys, shutil, time
 from enum import Enum
 import importlib.metadata
 
@@ -8,12 +8,18 @@ from gamuLogger import Logger, LEVELS
 from feanorTempDir import TempFile, TempDir
 
 from .virtualEnv import Venv
+from .stepStats import StepStats
+from .fileSet import FileIndex, FileSet
+from .trash import removeInBackground, findLeftovers, deleteInBackground
+from .stagingArea import RamTempDir, findRamDirectory, findStaleRamDirectories, getFreeRam, formatSize, RAM_USAGE_RATIO, VENV_SIZE_ESTIMATE
 
 Logger.setModule('Builder')
 
 feanorVersion = importlib.metadata.version('feanor')
 gamuLoggerVersion = importlib.metadata.version('gamuLogger')
 
+DEFAULT_EXCLUDE = ['*.pyc', '*.pyo', '__pycache__'] #type: list[str]
+
 class AbstractClassError(Exception):
     def __init__(self, message):
         super().__init__(message)
@@ -85,9 +91,7 @@ Use `python {your_script}.py -h` to see the available options
         self.__pathBase = pathBase
 
         self.__hasExpectedExport = False
-
-        self.__temp_dir = TempDir()
-        self.__temp_dir.create()
+        self.__venv = None #type: Venv|None
 
         self.__steps = {
             "Setup":        self.Status.WAITING,
@@ -99,6 +103,9 @@ Use `python {your_script}.py -h` to see the available options
         }
 
         self.__clean_enabled = not self.__args["no_clean"]
+        self.__plan_only = self.__args["plan"]
+
+        self.__stats = StepStats(pathBase)
 
         self.__remainingSteps = [step for step in self.__steps if self.__steps[step] != self.Status.DISABLED]
 
@@ -134,23 +141,28 @@ Use `python {your_script}.py -h` to see the available options
 
         Logger.setLevel('stdout', self.__debugLevel)
 
+        self.__temp_dir = self.__createTempDir()
+        self.__temp_dir.create()
+
         Logger.debug(f"Using python version : {sys.version}")
         Logger.debug(f"Using feanor version : {feanorVersion}")
         Logger.debug(f"Using gamuLogger version : {gamuLoggerVersion}")
         Logger.debug(f'Using temporary directory: {os.path.abspath(self.__temp_dir.path)}')
         Logger.debug('Using distribution directory: ' + os.path.abspath(self.__args["dist_dir"]))
 
-        # clear the dist directory
+        if self.__plan_only:
+            return
+
+        # clear the dist directory; its content, and the trash left by previous runs, are deleted in background
+        leftovers = []
+        for directory in {os.path.dirname(os.path.abspath(self.tempDir)), os.path.dirname(self.__distDir)}:
+            leftovers += findLeftovers(directory)
         try:
-            shutil.rmtree(self.__args["dist_dir"])
-        except FileNotFoundError:
-            pass
+            removeInBackground(self.__distDir, keepEmpty=True, leftovers=leftovers)
         except Exception as e:
             Logger.error(f'Error while cleaning dist directory: {str(e)}')
             sys.exit(1)
 
-        os.makedirs(self.__args["dist_dir"], exist_ok=True)
-
 
 #region PUBLIC PROPERTIES
 
@@ -246,18 +258,39 @@ Use `python {your_script}.py -h` to see the available options
         shutil.copy(path, f'{self.tempDir}/{dest}')
         return True   
 
-    def addDirectory(self, path, dest = None):
-        """Copy a directory to the temporary directory"""
+    def addDirectory(self, path, dest = None, include : list[str] = None, exclude : list[str] = DEFAULT_EXCLUDE, useGitignore = False):
+        """Copy a directory to the temporary directory\n
+        Only the files matching `include` (default: all) and not matching `exclude` are copied (see `fileSet`)"""
         if dest is None:
             dest = path
         if not os.path.isabs(path):
             path = os.path.join(self.pathBase, path)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f'Directory not found: {path}')
         Logger.debug(f'Adding directory: {path}')
-        shutil.copytree(
-            path,
-            f'{self.tempDir}/{dest}',
-            ignore=shutil.ignore_patterns('*.pyc', '*.pyo', '__pycache__'),
-        )
+        fileSet = self.fileSet(path, include, exclude, useGitignore)
+        self.__copyFileSet(fileSet, dest)
+        return True
+
+    def fileSet(self, path = '.', include : list[str] = None, exclude : list[str] = None, useGitignore = True) -> FileSet:
+        """Select files of a directory with glob patterns, using the same syntax as a .gitignore file\n
+        The project is indexed only once per run, so file sets can be created as often as needed\n
+        ```python
+        sources = self.fileSet('src', include=['*.py'], exclude=['tests/'])
+        ```
+        """
+        if not os.path.isabs(path):
+            path = os.path.join(self.pathBase, path)
+        path = os.path.abspath(path)
+        pathBase = os.path.abspath(self.pathBase)
+        if os.path.commonpath([path, pathBase]) == pathBase:
+            return FileSet(FileIndex.getInstance(pathBase), os.path.relpath(path, pathBase), include, exclude, useGitignore)
+        return FileSet(FileIndex.getInstance(path), '', include, exclude, useGitignore)
+
+    def addFileSet(self, fileSet : FileSet, dest = '.'):
+        """Copy the files of a file set to the temporary directory, keeping their path relative to the root of the file set"""
+        Logger.debug(f'Adding {len(fileSet)} files from {fileSet.root}')
+        self.__copyFileSet(fileSet, dest)
         return True
 
     def exportFile(self, path, dest = None):
@@ -273,17 +306,18 @@ Use `python {your_script}.py -h` to see the available options
             Logger.warning(f'Trying to export a file that does not exist: {path}')
             return False
     
-    def exportFolderContent(self, path, dest = None):
-        """Copy the content of a directory from the temporary directory to the distribution directory"""
+    def exportFolderContent(self, path, dest = None, include : list[str] = None, exclude : list[str] = None):
+        """Copy the content of a directory from the temporary directory to the distribution directory\n
+        Only the files matching `include` (default: all) and not matching `exclude` are copied (see `fileSet`)"""
         self.__hasExpectedExport = True
         if os.path.exists(f'{self.tempDir}/{path}'): #check if the directory exists
             if os.listdir(f'{self.tempDir}/{path}'): #check if the directory is not empty
                 Logger.debug(f'Exporting directory content: {path}')
                 if dest is None:
                     dest = path
-                for root, _, filenames in os.walk(f'{self.tempDir}/{path}'):
-                    for filename in filenames:
-                        shutil.copy(os.path.join(root, filename), f'{self.__distDir}/{filename}')
+                fileSet = FileSet(FileIndex(f'{self.tempDir}/{path}'), include=include, exclude=exclude, useGitignore=False)
+                for filePath in fileSet:
+                    shutil.copy(os.path.join(fileSet.root, filePath), f'{self.__distDir}/{os.path.basename(filePath)}')
 
                 return True
             else:
@@ -295,14 +329,20 @@ Use `python {your_script}.py -h` to see the available options
             )
             return False
 
-    def exportFolder(self, path, dest = None):
-        """Copy a directory from the temporary directory to the distribution directory"""
+    def exportFolder(self, path, dest = None, include : list[str] = None, exclude : list[str] = None):
+        """Copy a directory from the temporary directory to the distribution directory\n
+        Only the files matching `include` (default: all) and not matching `exclude` are copied (see `fileSet`)"""
         self.__hasExpectedExport = True
         if os.path.exists(f'{self.tempDir}/{path}'): #check if the directory exists
             Logger.debug(f'Exporting directory: {path}')
             if dest is None:
                 dest = path
-            shutil.copytree(f'{self.tempDir}/{path}', f'{self.__distDir}/{dest}')
+            if include is None and exclude is None:
+                shutil.copytree(f'{self.tempDir}/{path}', f'{self.__distDir}/{dest}')
+            else:
+                # the temporary directory changes during the build, so it is indexed again on each export
+                fileSet = FileSet(FileIndex(f'{self.tempDir}/{path}'), include=include, exclude=exclude, useGitignore=False)
+                self.__copyFileSet(fileSet, f'{self.__distDir}/{dest}')
             return True
         else:
             Logger.warning(f'Trying to export a directory that does not exist: {path}')
@@ -318,7 +358,10 @@ Use `python {your_script}.py -h` to see the available options
 
     def venv(self):
         """Create a virtual environment in the temporary directory"""
-        return Venv.getInstance(f'{self.tempDir}/env', self.tempDir, self.exportFile, self.__debugLevel)
+        if not os.path.exists(f'{self.tempDir}/env'):
+            self.__reserve('env', VENV_SIZE_ESTIMATE)
+        self.__venv = Venv.getInstance(f'{self.tempDir}/env', self.tempDir, self.exportFile, self.__debugLevel)
+        return self.__venv
 
 
 #endregion
@@ -346,9 +389,61 @@ Use `python {your_script}.py -h` to see the available options
 #region PRIVATE FUNCTIONS
 
 
+    def __createTempDir(self) -> TempDir|RamTempDir:
+        ramDirectory = findRamDirectory()
+        if ramDirectory is not None:
+            # directories left in RAM by an interrupted run are only freed by a reboot otherwise
+            deleteInBackground(findStaleRamDirectories(ramDirectory))
+
+        if self.__args["temp_backend"] != 'ram':
+            return TempDir()
+
+        if ramDirectory is None:
+            Logger.warning('No RAM backed directory found, using the disk for the temporary directory')
+            return TempDir()
+
+        # the files added to the temporary directory are taken from the project, so its size is used as estimation
+        # (with its own index: the dist directory is not cleared yet, so the shared one would be outdated)
+        estimatedSize = FileSet(FileIndex(self.pathBase)).size + VENV_SIZE_ESTIMATE
+        freeRam = getFreeRam(ramDirectory)
+        Logger.debug(f'Estimated size of the temporary directory: {formatSize(estimatedSize)} ({formatSize(freeRam)} free in {ramDirectory})')
+        if estimatedSize > freeRam * RAM_USAGE_RATIO:
+            Logger.warning(f'Not enough free memory for the temporary directory ({formatSize(estimatedSize)} needed, {formatSize(freeRam)} free), using the disk instead')
+            return TempDir()
+        return RamTempDir(ramDirectory)
+
+    def __reserve(self, dest : str, size : int) -> str:
+        if isinstance(self.__temp_dir, RamTempDir):
+            return self.__temp_dir.reserve(dest, size)
+        return f'{self.tempDir}/{dest}'
+
+    def __copyFileSet(self, fileSet : FileSet, dest : str):
+        destDir = self.__reserve(dest, fileSet.size)
+        if destDir is None:
+            # the root of the temporary directory stays in RAM, only its subdirectories can be moved to disk
+            destDir = self.tempDir
+            sizes = {} #type: dict[str, int]
+            for path in fileSet:
+                directory, separator, _ = path.partition('/')
+                if separator:
+                    sizes[directory] = sizes.get(directory, 0) + fileSet.fileSize(path)
+            for directory, size in sizes.items():
+                self.__reserve(directory, size)
+        os.makedirs(destDir, exist_ok=True)
+        for directory in fileSet.directories():
+            os.makedirs(os.path.join(destDir, directory), exist_ok=True)
+        for path in fileSet:
+            shutil.copy2(os.path.join(fileSet.root, path), os.path.join(destDir, path))
+        Logger.deepDebug(f'Copied {len(fileSet)} files from {fileSet.root} to {destDir}')
+
     def __clean(self) -> bool:
         Logger.info('Cleaning temporary directory')
         try:
+            # the worker runs the python of the virtual environment, which must not be in use when it is moved (Windows)
+            if self.__venv is not None:
+                self.__venv.stopWorker()
+            # the content is deleted in background, so feanor can exit immediately
+            removeInBackground(self.tempDir, keepEmpty=True)
             self.__temp_dir.remove()
         except Exception as e:
             Logger.error(f'Error while cleaning temp directory: {str(e)}')
@@ -393,6 +488,53 @@ Use `python {your_script}.py -h` to see the available options
             return False
         else:
             return True if hasSucceeded is None else hasSucceeded
+
+    def __disableBlockedSteps(self) -> list[str]:
+        '''
+        A step cannot run if one of its required dependencies is disabled, so it is disabled too\n
+        Return the steps that were explicitly requested (Publish with --publish) but had to be disabled
+        '''
+        blockedRequested = []
+        hasChanged = True
+        while hasChanged:
+            hasChanged = False
+            for step in list(self.__remainingSteps):
+                for dependency, requireMode in self.__stepDependencies[step].items():
+                    if requireMode == self.RequireMode.REQUIRED and self.__steps[dependency] == self.Status.DISABLED:
+                        if step == "Publish" and self.__args["publish"]:
+                            Logger.error(f'Step "{step}" was requested but cannot run because its required dependency "{dependency}" is disabled')
+                            blockedRequested.append(step)
+                        else:
+                            Logger.warning(f'Step "{step}" skipped because its required dependency "{dependency}" is disabled')
+                        self.__steps[step] = self.Status.DISABLED
+                        self.__remainingSteps.remove(step)
+                        hasChanged = True
+                        break
+        return blockedRequested
+
+    def __getStepDependencies(self) -> dict[str, list[str]]:
+        return {step: list(dependencies.keys()) for step, dependencies in self.__stepDependencies.items()}
+
+    def __printPlan(self):
+        steps = [step for step in self.__steps if self.__steps[step] != self.Status.DISABLED]
+        dependencies = self.__getStepDependencies()
+        criticalPath = self.__stats.criticalPath(steps, dependencies)
+
+        lines = ["planned steps (longest remaining path first):"]
+        paths = self.__stats.criticalPaths(steps, dependencies)
+        for step in sorted(steps, key=lambda step: paths[step], reverse=True):
+            duration = f'{self.__stats.getDuration(step):.2f}s' if self.__stats.hasDuration(step) else 'no history'
+            lines.append(f'{step} ({duration}, remaining path: {paths[step]:.2f}s)')
+        Logger.info("\n\t".join(lines))
+
+        missing = [step for step in steps if not self.__stats.hasDuration(step)]
+        if len(missing) > 0:
+            Logger.warning(f'No recorded duration for {", ".join(missing)}; the prediction does not include them')
+        # the steps run one after the other, so the build takes the sum of their durations
+        criticalTime = sum(self.__stats.getDuration(step) for step in criticalPath)
+        total = sum(self.__stats.getDuration(step) for step in steps)
+        Logger.info(f'predicted critical path: {" -> ".join(criticalPath)} ({criticalTime:.2f}s)')
+        Logger.info(f'predicted total time: {total:.2f}s (steps run one after the other)')
         
     def __listExport(self):
         files = []
@@ -409,28 +551,45 @@ Use `python {your_script}.py -h` to see the available options
                 if step in self.__remainingSteps:
                     self.__remainingSteps.remove(step)
                 Logger.debug(f'Step "{step}" disabled')
+        blockedRequested = self.__disableBlockedSteps()
 
-        HasFailed = False
-        while len(self.__remainingSteps) > 0 and not HasFailed:
-            for step in self.__steps:
-                if self.__steps[step] == self.Status.DISABLED:
-                    continue
-                Logger.deepDebug(f"evaluating step {step}\nremaining : {str(self.__remainingSteps)}")
-                if self.__steps[step] == self.Status.WAITING and self.__canStepBeStarted(step):
-                    Logger.info(f'Starting step "{step}"')
-                    self.__steps[step] = self.Status.RUNNING
+        if self.__plan_only:
+            self.__printPlan()
+            self.__temp_dir.keep = True
+            self.__clean()
+            return
 
-                    hasSucceeded = self.__runStep(step)
-                    Logger.deepDebug(f'Step "{step}" returned {str(hasSucceeded)}')
+        # start the steps with the longest remaining path first, according to the recorded durations
+        criticalPaths = self.__stats.criticalPaths(self.__remainingSteps, self.__getStepDependencies())
 
-                    if hasSucceeded:
-                        self.__steps[step] = self.Status.FINISHED
-                        self.__remainingSteps.remove(step)
-                    else:
-                        self.__steps[step] = self.Status.FAILED
-                        Logger.error(f'Step "{step}" failed')
-                        HasFailed = True
-                        break
+        HasFailed = len(blockedRequested) > 0
+        while len(self.__remainingSteps) > 0 and not HasFailed:
+            Logger.deepDebug(f"remaining : {str(self.__remainingSteps)}")
+            readySteps = [step for step in self.__remainingSteps if self.__steps[step] == self.Status.WAITING and self.__canStepBeStarted(step)]
+            if len(readySteps) == 0:
+                Logger.error(f'No step can be started, remaining steps are blocked: {", ".join(self.__remainingSteps)}')
+                HasFailed = True
+                break
+
+            step = max(readySteps, key=lambda step: criticalPaths[step])
+            Logger.info(f'Starting step "{step}"')
+            self.__steps[step] = self.Status.RUNNING
+
+            start = time.perf_counter()
+            hasSucceeded = self.__runStep(step)
+            duration = time.perf_counter() - start
+            Logger.deepDebug(f'Step "{step}" returned {str(hasSucceeded)} after {duration:.2f}s')
+
+            if hasSucceeded:
+                self.__steps[step] = self.Status.FINISHED
+                self.__remainingSteps.remove(step)
+                self.__stats.record(step, duration)
+            else:
+                self.__steps[step] = self.Status.FAILED
+                Logger.error(f'Step "{step}" failed')
+                HasFailed = True
+
+        self.__stats.save()
 
         if self.__clean_enabled:
             self.__temp_dir.keep = True
@@ -469,9 +628,15 @@ Use `python {your_script}.py -h` to see the available options
         buildersOptions.add_argument('--no-build', action='store_true', help='Only run tests, do not build the package')
         buildersOptions.add_argument('--publish', action='store_true', help='Publish the package')
         buildersOptions.add_argument('--no-clean', action='store_true', help='Do not clean temporary files')
+        buildersOptions.add_argument('--plan', action='store_true', help='Print the predicted critical path and total time, without running any step')
+        buildersOptions.add_argument('--temp-backend', help='Where to create the temporary directory; "ram" use a tmpfs like /dev/shm, and fall back to the disk if there is not enough free memory (default : "%(default)s")', type=str, choices=['disk', 'ram'], default='disk')
         buildersOptions.add_argument('--dist-dir', help='Distribution directory (where to save the built files) (default : "%(default)s")', type=str, default='dist')
         buildersOptions.add_argument('-pv', '--package-version', help='set the version of the package you want to build (default : "%(default)s")', type=str, default='0.0.0')
         
+        workspaceOptions = argumentParser.add_argument_group('Workspace options')
+        workspaceOptions.add_argument('--workspace', help='Build all the packages found in ROOT, each one described by its own build file (default ROOT : "%(const)s")', type=str, nargs='?', const='.', default=None, metavar='ROOT')
+        workspaceOptions.add_argument('-j', '--jobs', help='Number of packages built at the same time in workspace mode (default : number of CPUs)', type=int, default=None)
+
         argumentParser.add_argument('--version', '-v', action='store_true', help='Show the version of the tool')
         argumentParser.add_argument('--help', '-h', action='store_true', help='Show this help message and exit')
         
@@ -485,7 +650,7 @@ Use `python {your_script}.py -h` to see the available options
             Logger.error('Error while parsing arguments; use -h to see the available options')
             raise RuntimeError('Error while parsing arguments') from e
         else:
-            reservedArgsKeys = ['debug', 'deep_debug', 'no_tests', 'no_build', 'no_docs', 'publish', 'no_clean', 'dist_dir', 'package_version', 'help', 'version']
+            reservedArgsKeys = ['debug', 'deep_debug', 'no_tests', 'no_build', 'no_docs', 'publish', 'no_clean', 'plan', 'temp_backend', 'dist_dir', 'package_version', 'workspace', 'jobs', 'help', 'version']
 
             # split the args into two lists (args, custom_args)
             args = {key: value for key, value in vars(allArgs).items() if key in reservedArgsKeys}
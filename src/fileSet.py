@@ -0,0 +1,380 @@
+from gamuLogger import Logger
+import os
+import re
+
+from .trash import TRASH_PREFIX
+
+GITIGNORE = '.gitignore' #type: str
+
+Logger.setModule("FileSet")
+
+class GlobPattern:
+    """
+    A glob pattern, using the same rules as a .gitignore file:
+    - a pattern without a slash match a file or a directory at any depth (`*.pyc`, `__pycache__`)
+    - a pattern with a slash is anchored to the base directory (`src/*.py`, `/build`)
+    - `**` match any number of directories, `*` and `?` never match a slash
+    - a trailing slash only match directories (`node_modules/`)
+    """
+    def __init__(self, pattern : str):
+        self.__pattern = pattern
+        self.__dirOnly = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        regex = GlobPattern.__translate(pattern.lstrip('/'))
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        self.__regex = re.compile(regex)
+
+#region PROPERTIES
+
+    @property
+    def pattern(self):
+        """the original pattern"""
+        return self.__pattern
+
+
+#endregion
+#region PUBLIC FUNCTIONS
+
+
+    def match(self, path : str, isDir : bool) -> bool:
+        """Check if a path (relative to the base directory, using '/' as separator) match the pattern"""
+        if self.__dirOnly and not isDir:
+            return False
+        return self.__regex.fullmatch(path) is not None
+
+    def matchWithParents(self, path : str, isDir : bool) -> bool:
+        """Check if a path, or one of the directories containing it, match the pattern"""
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            if self.match('/'.join(parts[:i]), True):
+                return True
+        return self.match(path, isDir)
+
+
+#endregion
+#region PRIVATE STATIC FUNCTIONS
+
+
+    @staticmethod
+    def __translate(pattern : str) -> str:
+        regex = ''
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if pattern.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                regex += '.*'
+                i += 2
+                continue
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            elif char == '[' and ']' in pattern[i+1:]:
+                end = pattern.index(']', i+1)
+                content = pattern[i+1:end]
+                if content.startswith('!'):
+                    content = '^' + content[1:]
+                regex += f'[{content}]'
+                i = end
+            elif char == '\\' and i + 1 < len(pattern):
+                i += 1
+                regex += re.escape(pattern[i])
+            else:
+                regex += re.escape(char)
+            i += 1
+        return regex
+
+#endregion
+
+
+
+class FileIndex:
+    """
+    Index of all the files of a directory; each directory is read with `os.scandir` the first time it is queried,
+    so the directories pruned by the file sets (.git, ignored or excluded directories) are never read\n
+    A directory is read again when its modification time changes, so files added or removed during the build are seen
+    (the size of a file rewritten in place may be outdated)\n
+    Symbolic links to directories are followed, unless they point to one of the directories containing them\n
+    The trash directories of feanor are never indexed
+    """
+    __instances = {} #type: dict[str, FileIndex]
+
+    def __init__(self, root : str):
+        self.__root = os.path.abspath(root)
+        self.__dirs = {} #type: dict[str, tuple[int, tuple[list[str], dict[str, int]]]] # modification time and content of each directory read
+        self.__gitignoreRules = {} #type: dict[str, list[tuple[str, GlobPattern, bool]]]
+
+#region PROPERTIES
+
+    @property
+    def root(self):
+        """the absolute path of the indexed directory"""
+        return self.__root
+
+
+#endregion
+#region PUBLIC FUNCTIONS
+
+
+    def isDir(self, path : str) -> bool:
+        """Check if a path (relative to the root of the index) is an indexed directory"""
+        return self.__getDir(FileIndex.__normalize(path)) is not None
+
+    def walk(self, top : str = ''):
+        """
+        Same as `os.walk`, but read from the index; paths are relative to the root of the index\n
+        As with `os.walk`, the list of subdirectories can be modified in place to prune the walk
+        """
+        topPath = FileIndex.__normalize(top)
+        stack = [topPath]
+        while len(stack) > 0:
+            current = stack.pop()
+            entry = self.__getDir(current) if current == topPath else self.__getScanned(current)
+            if entry is None:
+                continue
+            subdirs, files = entry
+            subdirs = list(subdirs)
+            yield current, subdirs, list(files.keys())
+            stack.extend(FileIndex.__join(current, subdir) for subdir in reversed(subdirs))
+
+    def size(self, path : str) -> int:
+        """The size in bytes of an indexed file, or the total size of the files of an indexed directory"""
+        path = FileIndex.__normalize(path)
+        if self.__getDir(path) is not None:
+            return sum(sum(self.__getDir(current)[1].values()) for current, _, _ in self.walk(path))
+        parent, _, name = path.rpartition('/')
+        entry = self.__getDir(parent)
+        return entry[1].get(name, 0) if entry is not None else 0
+
+    def isGitignored(self, path : str, isDir : bool) -> bool:
+        """Check if a path (relative to the root of the index) is ignored by the .gitignore files of the index"""
+        path = FileIndex.__normalize(path)
+        if path == '.git' or path.startswith('.git/'):
+            return True
+        ignored = False
+        for base, pattern, negate in self.__getGitignoreRules(path.rpartition('/')[0]):
+            relPath = path[len(base)+1:] if base else path
+            if pattern.match(relPath, isDir):
+                ignored = not negate
+        return ignored
+
+
+#endregion
+#region STATIC FUNCTIONS
+
+
+    @staticmethod
+    def getInstance(root : str) -> 'FileIndex':
+        """Get the index of a directory, create it if it doesn't exist"""
+        root = os.path.abspath(root)
+        if root not in FileIndex.__instances:
+            Logger.debug(f"Creating new file index for {root}")
+            FileIndex.__instances[root] = FileIndex(root)
+        return FileIndex.__instances[root]
+
+
+#endregion
+#region PRIVATE FUNCTIONS
+
+
+    def __getDir(self, path : str) -> tuple[list[str], dict[str, int]]|None:
+        if path == '':
+            return self.__getScanned(path)
+        parent, _, name = path.rpartition('/')
+        parentEntry = self.__getDir(parent)
+        if parentEntry is None or name not in parentEntry[0]:
+            return None
+        return self.__getScanned(path)
+
+    def __getScanned(self, path : str) -> tuple[list[str], dict[str, int]]|None:
+        # the path is known to be an indexed directory; it is read again if it changed since the last time
+        try:
+            modificationTime = os.stat(os.path.join(self.__root, path)).st_mtime_ns
+        except OSError:
+            return None
+        if path not in self.__dirs or self.__dirs[path][0] != modificationTime:
+            if path in self.__dirs:
+                Logger.deepDebug(f'Directory {os.path.join(self.__root, path)} changed, reading it again')
+                self.__gitignoreRules.clear()
+            self.__dirs[path] = (modificationTime, self.__scan(path))
+        return self.__dirs[path][1]
+
+    def __scan(self, path : str) -> tuple[list[str], dict[str, int]]:
+        subdirs, files = [], {}
+        directory = os.path.join(self.__root, path)
+        realDirectory = os.path.realpath(directory)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(TRASH_PREFIX):
+                        continue
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            realPath = os.path.realpath(entry.path)
+                            if os.path.commonpath([realPath, realDirectory]) == realPath:
+                                Logger.deepDebug(f'Not following symbolic link {entry.path}, it points to one of the directories containing it')
+                                continue
+                        subdirs.append(entry.name)
+                    else:
+                        try:
+                            files[entry.name] = entry.stat().st_size
+                        except OSError:
+                            files[entry.name] = 0
+        except OSError as e:
+            Logger.warning(f'Could not index directory {directory}: {str(e)}')
+        Logger.deepDebug(f'Indexed {len(files)} files and {len(subdirs)} directories in {directory}')
+        return sorted(subdirs), dict(sorted(files.items()))
+
+    def __getGitignoreRules(self, directory : str) -> list[tuple[str, GlobPattern, bool]]:
+        if directory not in self.__gitignoreRules:
+            rules = self.__getGitignoreRules(directory.rpartition('/')[0]) if directory else []
+            entry = self.__getDir(directory)
+            if entry is not None and GITIGNORE in entry[1]:
+                rules = rules + self.__readGitignore(directory)
+            self.__gitignoreRules[directory] = rules
+        return self.__gitignoreRules[directory]
+
+    def __readGitignore(self, directory : str) -> list[tuple[str, GlobPattern, bool]]:
+        rules = []
+        try:
+            with open(os.path.join(self.__root, directory, GITIGNORE), 'r') as file:
+                lines = file.read().splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            Logger.warning(f'Could not read {os.path.join(self.__root, directory, GITIGNORE)}: {str(e)}')
+            return rules
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            rules.append((directory, GlobPattern(line), negate))
+        return rules
+
+
+#endregion
+#region PRIVATE STATIC FUNCTIONS
+
+
+    @staticmethod
+    def __normalize(path : str) -> str:
+        path = path.replace(os.sep, '/').strip('/')
+        return '' if path == '.' else path
+
+    @staticmethod
+    def __join(directory : str, name : str) -> str:
+        return f'{directory}/{name}' if directory else name
+
+#endregion
+
+
+
+class FileSet:
+    """
+    A set of files of a directory, selected with include and exclude glob patterns (see `GlobPattern`)\n
+    The files are read from a `FileIndex`, so the directory is never walked again\n
+    `.git` directories are always skipped, and ignored directories are skipped without being read\n
+    ```python
+    sources = FileSet(index, 'src', include=['*.py'], exclude=['tests/'])
+    for path in sources:
+        ...
+    ```
+    """
+    def __init__(self, index : FileIndex, root : str = '', include : list[str] = None, exclude : list[str] = None, useGitignore : bool = True):
+        self.__index = index
+        self.__root = os.path.relpath(os.path.join(index.root, root), index.root).replace(os.sep, '/')
+        if self.__root == '.':
+            self.__root = ''
+        self.__include = [GlobPattern(pattern) for pattern in include] if include else None #type: list[GlobPattern]|None
+        self.__exclude = [GlobPattern(pattern) for pattern in exclude] if exclude else [] #type: list[GlobPattern]
+        self.__useGitignore = useGitignore
+        self.__files = None #type: list[str]
+
+#region PROPERTIES
+
+    @property
+    def root(self):
+        """the absolute path of the root of the file set"""
+        return os.path.join(self.__index.root, self.__root)
+
+    @property
+    def files(self) -> list[str]:
+        """the selected files, relative to the root of the file set"""
+        if self.__files is None:
+            self.__files = self.__select()
+        return self.__files
+
+    @property
+    def size(self) -> int:
+        """the total size in bytes of the selected files"""
+        return sum(self.fileSize(path) for path in self.files)
+
+
+#endregion
+#region PUBLIC FUNCTIONS
+
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def fileSize(self, path : str) -> int:
+        """the size in bytes of a selected file, relative to the root of the file set"""
+        return self.__index.size(self.__indexPath(path))
+
+    def directories(self) -> list[str]:
+        """the directories containing at least one selected file, relative to the root of the file set"""
+        directories = set()
+        for path in self.files:
+            parent = path.rpartition('/')[0]
+            while parent and parent not in directories:
+                directories.add(parent)
+                parent = parent.rpartition('/')[0]
+        return sorted(directories)
+
+
+#endregion
+#region PRIVATE FUNCTIONS
+
+
+    def __indexPath(self, path : str) -> str:
+        return f'{self.__root}/{path}' if self.__root and path else self.__root or path
+
+    def __isExcluded(self, path : str, isDir : bool) -> bool:
+        if isDir and path.rpartition('/')[2] == '.git':
+            return True
+        if self.__useGitignore and self.__index.isGitignored(self.__indexPath(path), isDir):
+            return True
+        return any(pattern.match(path, isDir) for pattern in self.__exclude)
+
+    def __isIncluded(self, path : str) -> bool:
+        if self.__include is None:
+            return True
+        return any(pattern.matchWithParents(path, False) for pattern in self.__include)
+
+    def __select(self) -> list[str]:
+        if not self.__index.isDir(self.__root):
+            Logger.warning(f'Trying to select files from a directory that does not exist: {self.root}')
+            return []
+        files = []
+        for current, subdirs, filenames in self.__index.walk(self.__root):
+            relDir = current[len(self.__root):].lstrip('/')
+            prefix = f'{relDir}/' if relDir else ''
+            subdirs[:] = [subdir for subdir in subdirs if not self.__isExcluded(prefix + subdir, True)]
+            for filename in filenames:
+                path = prefix + filename
+                if not self.__isExcluded(path, False) and self.__isIncluded(path):
+                    files.append(path)
+        Logger.deepDebug(f'Selected {len(files)} files in {self.root}')
+        return files
+
+#endregion
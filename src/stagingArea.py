@@ -0,0 +1,153 @@
+from gamuLogger import Logger
+import os
+import re
+import random
+import shutil
+from string import ascii_lowercase
+
+from feanorTempDir import TempDir
+
+from .trash import removeInBackground
+
+
+RAM_DIRECTORIES = ['/dev/shm', '/run/shm'] #type: list[str]
+RAM_USAGE_RATIO = 0.5 #type: float # never fill more than this part of the free memory
+VENV_SIZE_ESTIMATE = 100 * 1024 * 1024 #type: int # a venv with a few packages installed
+RAM_DIRECTORY_PATTERN = re.compile(r'feanor-(\d+)-[a-z]+') #type: re.Pattern # the pid of the run that created it is part of the name
+
+Logger.setModule("StagingArea")
+
+
+def findRamDirectory() -> str|None:
+    """Return the first writable tmpfs directory found, None if there is none"""
+    for directory in RAM_DIRECTORIES:
+        if os.path.isdir(directory) and os.access(directory, os.W_OK):
+            return directory
+    return None
+
+def getFreeRam(directory : str) -> int:
+    """Return the number of bytes that can be written in a tmpfs directory, limited by the available memory"""
+    free = shutil.disk_usage(directory).free
+    try:
+        with open('/proc/meminfo', 'r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    free = min(free, int(line.split()[1]) * 1024)
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return free
+
+def findStaleRamDirectories(ramDirectory : str) -> list[str]:
+    """Return the directories created in a tmpfs directory by runs of the current user that are not running anymore"""
+    stale = []
+    try:
+        names = os.listdir(ramDirectory)
+    except OSError:
+        return stale
+    for name in names:
+        match = RAM_DIRECTORY_PATTERN.fullmatch(name)
+        if match is None:
+            continue
+        path = os.path.join(ramDirectory, name)
+        try:
+            if os.stat(path).st_uid != os.getuid():
+                continue
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            Logger.debug(f'Removing {path}, left by an interrupted run')
+            stale.append(path)
+        except OSError:
+            continue
+    return stale
+
+def formatSize(size : int) -> str:
+    """Format a size in bytes to a human readable string"""
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}GiB'
+
+
+class RamTempDir:
+    """
+    A temporary directory located on a tmpfs (RAM), with the same interface as `feanorTempDir.TempDir`\n
+    Directories that do not fit in the free memory are spilled to a temporary directory on disk, and linked in the RAM directory
+    """
+    def __init__(self, ramDirectory : str):
+        self.__path = os.path.join(ramDirectory, f'feanor-{os.getpid()}-' + ''.join(random.choice(ascii_lowercase) for _ in range(10)))
+        self.__created = False
+        self.__keep = True
+        self.__spilled = [] #type: list[TempDir]
+
+#region PROPERTIES
+
+    @property
+    def keep(self):
+        return self.__keep
+
+    @keep.setter
+    def keep(self, value : bool):
+        self.__keep = value
+
+    @property
+    def path(self):
+        """the path of the temporary directory"""
+        return self.__path
+
+
+#endregion
+#region PUBLIC FUNCTIONS
+
+
+    def create(self):
+        if self.__created:
+            Logger.error(f"Cannot create temporary directory \"{self.__path}\" because it already exist")
+            raise FileExistsError("Directory already exist")
+        os.mkdir(self.__path)
+        Logger.deepDebug(f"RamTempDir: {self.__path} created")
+        self.__created = True
+        return self.path
+
+    def remove(self):
+        if not self.__created:
+            Logger.error(f"Cannot delete temporary directory \"{self.__path}\" because it was not created")
+            raise FileNotFoundError("Folder does not exist")
+        shutil.rmtree(self.__path)
+        for spilled in self.__spilled:
+            removeInBackground(spilled.path, keepEmpty=True)
+            spilled.remove()
+        self.__spilled = []
+        Logger.deepDebug(f"RamTempDir: {self.__path} removed")
+        self.__created = False
+
+    def reserve(self, dest : str, size : int) -> str:
+        """
+        Prepare the path `dest` (relative to the temporary directory) to receive `size` bytes\n
+        If there is not enough free memory, `dest` is linked to a new directory on disk, and what it already contains is moved there\n
+        Return the path where the content must be written, None if `dest` is the temporary directory itself,
+        as it cannot be moved to disk (its subdirectories must be reserved one by one)
+        """
+        target = os.path.normpath(os.path.join(self.__path, dest))
+        if os.path.commonpath([os.path.realpath(target), os.path.realpath(self.__path)]) != os.path.realpath(self.__path):
+            return target # already on disk
+        free = getFreeRam(self.__path)
+        if size <= free * RAM_USAGE_RATIO:
+            return target
+        if target == os.path.normpath(self.__path):
+            return None
+
+        spilled = TempDir()
+        spilled.create()
+        self.__spilled.append(spilled)
+        if os.path.isdir(target):
+            for name in os.listdir(target):
+                shutil.move(os.path.join(target, name), spilled.path)
+            os.rmdir(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.symlink(spilled.path, target, target_is_directory=True)
+        Logger.info(f'Not enough free memory for "{dest}" ({formatSize(size)} needed, {formatSize(free)} free), moved to disk at {spilled.path}')
+        return target
+
+#endregion
@@ -0,0 +1,114 @@
+from gamuLogger import Logger
+import os
+import json
+
+
+STATS_FILE = '.feanor-stats.json' #type: str
+SMOOTHING = 0.5 #type: float # weight of the newest sample in the recorded average
+
+Logger.setModule("StepStats")
+
+class StepStats:
+    """
+    Store the wall time of each step of a project, between runs\n
+    The durations are saved in a small json file located next to the pack file (or at the root of the workspace)
+    """
+
+    def __init__(self, pathBase : str, fileName : str = STATS_FILE):
+        self.__path = os.path.join(pathBase, fileName)
+        self.__durations = {} #type: dict[str, float]
+        self.__load()
+
+#region PROPERTIES
+
+    @property
+    def path(self):
+        """the path to the stats file"""
+        return self.__path
+
+
+#endregion
+#region PUBLIC FUNCTIONS
+
+
+    def hasDuration(self, step : str) -> bool:
+        """Check if a duration has been recorded for a step"""
+        return step in self.__durations
+
+    def getDuration(self, step : str) -> float:
+        """Get the recorded duration of a step (in seconds), 0 if the step has never been recorded"""
+        return self.__durations.get(step, 0.0)
+
+    def record(self, step : str, duration : float):
+        """Record a new duration for a step, smoothed with the previous ones"""
+        if step in self.__durations:
+            duration = SMOOTHING * duration + (1 - SMOOTHING) * self.__durations[step]
+        Logger.deepDebug(f'Recording duration {duration:.3f}s for step "{step}"')
+        self.__durations[step] = duration
+
+    def save(self):
+        """Write the recorded durations to the stats file"""
+        try:
+            with open(self.__path, 'w') as file:
+                json.dump({"steps": self.__durations}, file, indent=4)
+        except OSError as e:
+            Logger.warning(f'Could not save step durations to {self.__path}: {str(e)}')
+        else:
+            Logger.debug(f'Step durations saved to {self.__path}')
+
+    def criticalPaths(self, steps : list[str], dependencies : dict[str, list[str]]) -> dict[str, float]:
+        """
+        Compute, for each step, the duration of the longest chain of steps starting with it\n
+        `dependencies` map each step to the steps it waits for; only the given steps are considered
+        """
+        dependents = {step: [] for step in steps} #type: dict[str, list[str]]
+        for step in steps:
+            for dependency in dependencies[step]:
+                if dependency in dependents:
+                    dependents[dependency].append(step)
+
+        paths = {} #type: dict[str, float]
+        def compute(step : str) -> float:
+            if step not in paths:
+                paths[step] = self.getDuration(step) + max((compute(dependent) for dependent in dependents[step]), default=0.0)
+            return paths[step]
+
+        for step in steps:
+            compute(step)
+        return paths
+
+    def criticalPath(self, steps : list[str], dependencies : dict[str, list[str]]) -> list[str]:
+        """Return the chain of steps that determine the total duration of the build"""
+        paths = self.criticalPaths(steps, dependencies)
+        dependents = {step: [other for other in steps if step in dependencies[other]] for step in steps}
+
+        roots = [step for step in steps if not any(dependency in steps for dependency in dependencies[step])]
+        if len(roots) == 0:
+            return []
+        current = max(roots, key=lambda step: paths[step])
+        chain = [current]
+        while len(dependents[current]) > 0:
+            current = max(dependents[current], key=lambda step: paths[step])
+            chain.append(current)
+        return chain
+
+
+#endregion
+#region PRIVATE FUNCTIONS
+
+
+    def __load(self):
+        if not os.path.exists(self.__path):
+            Logger.debug(f'No step durations recorded yet ({self.__path} not found)')
+            return
+        try:
+            with open(self.__path, 'r') as file:
+                data = json.load(file)
+            self.__durations = {step: float(duration) for step, duration in data["steps"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            Logger.warning(f'Could not read step durations from {self.__path}, ignoring them: {str(e)}')
+            self.__durations = {}
+        else:
+            Logger.debug(f'Step durations loaded from {self.__path}')
+
+#endregion
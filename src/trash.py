@@ -0,0 +1,104 @@
+from gamuLogger import Logger
+import os
+import sys
+import random
+import shutil
+import subprocess
+from string import ascii_lowercase
+
+
+IS_POSIX = os.name == 'posix' #type: bool
+TRASH_PREFIX = '.feanor-trash' #type: str
+TRASH_DIRECTORY = f'{TRASH_PREFIX}-{os.getuid()}' if IS_POSIX else TRASH_PREFIX #type: str # one per user, as the temporary directory is shared
+
+Logger.setModule("Trash")
+
+
+def getTrashDirectory(path : str) -> str:
+    """Return the trash directory used for a path; it is located next to it, so moving the path there is an atomic rename"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), TRASH_DIRECTORY)
+
+def moveToTrash(path : str) -> str|None:
+    """
+    Move a directory to the trash directory next to it\n
+    Return the new path of the directory, None if it could not be moved
+    """
+    trashDirectory = getTrashDirectory(path)
+    trashedPath = os.path.join(trashDirectory, ''.join(random.choice(ascii_lowercase) for _ in range(10)))
+    try:
+        os.makedirs(trashDirectory, exist_ok=True)
+        os.rename(path, trashedPath)
+    except OSError as e:
+        Logger.debug(f'Could not move {path} to the trash: {str(e)}')
+        removeIfEmpty(trashDirectory)
+        return None
+    Logger.deepDebug(f'{path} moved to {trashedPath}')
+    return trashedPath
+
+def findLeftovers(directory : str) -> list[str]:
+    """Return the content of the trash directory located in `directory`, left behind by a previous run"""
+    trashDirectory = os.path.join(directory, TRASH_DIRECTORY)
+    if not os.path.isdir(trashDirectory):
+        return []
+    leftovers = [os.path.join(trashDirectory, name) for name in os.listdir(trashDirectory)]
+    if len(leftovers) == 0:
+        removeIfEmpty(trashDirectory)
+    return leftovers
+
+def removeIfEmpty(directory : str):
+    """Remove a directory if it is empty, do nothing otherwise"""
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+def deleteInBackground(paths : list[str]):
+    """Delete directories in a detached process, that keeps running after feanor exits\n
+    The trash directories containing them are removed too once they are empty (so they do not stay in the project)"""
+    if len(paths) == 0:
+        return
+    Logger.deepDebug('Deleting in background: ' + ', '.join(paths))
+    script = (
+        'import os, shutil, sys\n'
+        'for path in sys.argv[2:]:\n'
+        '    shutil.rmtree(path, ignore_errors=True)\n'
+        '    if os.path.basename(os.path.dirname(path)) == sys.argv[1]:\n'
+        '        try:\n'
+        '            os.rmdir(os.path.dirname(path))\n'
+        '        except OSError:\n'
+        '            pass'
+    )
+    kwargs = {'start_new_session': True} if IS_POSIX else {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    try:
+        subprocess.Popen(
+            [sys.executable, '-c', script, TRASH_DIRECTORY, *paths],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            close_fds=True, **kwargs
+        )
+    except OSError as e:
+        Logger.debug(f'Could not start the background deletion, deleting now: {str(e)}')
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+            if os.path.basename(os.path.dirname(path)) == TRASH_DIRECTORY:
+                removeIfEmpty(os.path.dirname(path))
+
+def removeInBackground(path : str, keepEmpty : bool = False, leftovers : list[str] = None):
+    """
+    Remove a directory without waiting: it is moved to the trash, then deleted by a detached process\n
+    If `keepEmpty` is True, an empty directory is left at its place\n
+    `leftovers` are deleted by the same process\n
+    If `path` is a symbolic link, the link is kept and the directory it points to is removed instead\n
+    Fall back to a synchronous deletion if the directory cannot be moved
+    """
+    toDelete = list(leftovers) if leftovers is not None else []
+    if os.path.islink(path):
+        path = os.path.realpath(path)
+    if os.path.exists(path):
+        trashedPath = moveToTrash(path)
+        if trashedPath is None:
+            shutil.rmtree(path)
+        else:
+            toDelete.append(trashedPath)
+    if keepEmpty:
+        os.makedirs(path, exist_ok=True)
+    deleteInBackground(toDelete)
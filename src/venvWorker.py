@@ -0,0 +1,83 @@
+from gamuLogger import Logger
+import os
+import json
+import subprocess
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'venvWorkerProcess.py') #type: str
+
+Logger.setModule("VenvWorker")
+
+class VenvWorker:
+    """
+    A python process running in a virtual environment, that execute modules with `runpy` instead of starting a new interpreter each time\n
+    The process is recycled after `maxTasks` tasks, or after a task failed
+    """
+    def __init__(self, python : str, maxTasks : int = 100):
+        self.__python = python
+        self.__maxTasks = maxTasks
+        self.__process = None #type: subprocess.Popen|None
+        self.__taskCount = 0
+
+#region PUBLIC FUNCTIONS
+
+
+    def runModule(self, module : str, argv : list[str], cwd : str) -> tuple[int, str, str]:
+        """
+        Run a module in the worker, as `python -m module *argv` would do in `cwd`\n
+        Return the return code, the stdout and the stderr of the module
+        """
+        if self.__process is None:
+            self.__start()
+
+        request = {"module": module, "argv": argv, "cwd": os.path.abspath(cwd)}
+        try:
+            self.__process.stdin.write(json.dumps(request) + '\n')
+            self.__process.stdin.flush()
+            line = self.__process.stdout.readline()
+            if not line:
+                raise BrokenPipeError('the worker exited')
+            response = json.loads(line)
+        except (OSError, ValueError) as e:
+            Logger.debug(f'Worker process failed while running module "{module}": {str(e)}')
+            self.stop()
+            return 1, '', f'worker process failed: {str(e)}'
+
+        self.__taskCount += 1
+        if response["returnCode"] != 0:
+            Logger.deepDebug('Recycling worker process after a failed task')
+            self.stop()
+        elif self.__taskCount >= self.__maxTasks:
+            Logger.deepDebug(f'Recycling worker process after {self.__taskCount} tasks')
+            self.stop()
+        return response["returnCode"], response["stdout"], response["stderr"]
+
+    def stop(self):
+        """Stop the worker process; a new one will be started by the next task"""
+        if self.__process is None:
+            return
+        try:
+            self.__process.stdin.close()
+            self.__process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.__process.kill()
+            self.__process.wait()
+        self.__process.stdout.close()
+        Logger.deepDebug(f'Worker process {self.__process.pid} stopped')
+        self.__process = None
+        self.__taskCount = 0
+
+
+#endregion
+#region PRIVATE FUNCTIONS
+
+
+    def __start(self):
+        self.__process = subprocess.Popen(
+            [self.__python, WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True
+        )
+        Logger.deepDebug(f'Worker process {self.__process.pid} started with {self.__python}')
+
+#endregion
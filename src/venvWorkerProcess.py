@@ -0,0 +1,111 @@
+"""
+Persistent worker started with the python of a virtual environment, see `VenvWorker`\n
+This file is executed directly by the virtual environment, so it must only use the standard library\n
+Each request is a json line read from stdin: `{"module": str, "argv": list[str], "cwd": str}`\n
+Each response is a json line written to stdout: `{"returnCode": int, "stdout": str, "stderr": str}`
+"""
+import os
+import sys
+import json
+import site
+import runpy
+import tempfile
+import traceback
+import importlib
+
+
+def isInDirectory(module, directory : str) -> bool:
+    """Check if a module was loaded from a file located in `directory`"""
+    paths = [getattr(module, '__file__', None)] + list(getattr(module, '__path__', None) or [])
+    for path in paths:
+        if isinstance(path, str) and os.path.commonpath([os.path.realpath(path), directory]) == directory:
+            return True
+    return False
+
+def getEnvironmentDirectories() -> list[str]:
+    """Return the directories of the python installation and of the virtual environment, where the installed packages are"""
+    directories = {sys.prefix, sys.exec_prefix, sys.base_prefix, sys.base_exec_prefix}
+    try:
+        directories.update(site.getsitepackages())
+    except AttributeError:
+        pass
+    return [os.path.realpath(directory) for directory in directories]
+
+def unloadModules(savedModules : set[str], directory : str):
+    """Forget the modules imported from `directory` since `savedModules`, so the next tasks import them again, like a new interpreter would\n
+    The installed packages stay loaded, even if the virtual environment is located in `directory`"""
+    directory = os.path.realpath(directory)
+    environmentDirectories = getEnvironmentDirectories()
+    for name in list(sys.modules):
+        module = sys.modules[name]
+        if name not in savedModules and isInDirectory(module, directory) and not any(isInDirectory(module, environmentDirectory) for environmentDirectory in environmentDirectories):
+            del sys.modules[name]
+
+def runTask(task : dict) -> dict:
+    """Run a module as `python -m module *argv` would, with its output captured"""
+    savedArgv, savedPath, savedCwd = sys.argv, list(sys.path), os.getcwd()
+    savedModules = set(sys.modules)
+    savedFds = os.dup(1), os.dup(2)
+    with tempfile.TemporaryFile() as stdoutFile, tempfile.TemporaryFile() as stderrFile:
+        # redirect the file descriptors, so the output of subprocesses and C extensions is captured too
+        os.dup2(stdoutFile.fileno(), 1)
+        os.dup2(stderrFile.fileno(), 2)
+        try:
+            os.chdir(task['cwd'])
+            sys.argv = [task['module']] + task['argv']
+            sys.path.insert(0, task['cwd'])
+            importlib.invalidate_caches()
+            runpy.run_module(task['module'], run_name='__main__', alter_sys=True)
+            returnCode = 0
+        except SystemExit as e:
+            if e.code is None:
+                returnCode = 0
+            elif isinstance(e.code, int):
+                returnCode = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                returnCode = 1
+        except BaseException:
+            traceback.print_exc()
+            returnCode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(savedFds[0], 1)
+            os.dup2(savedFds[1], 2)
+            os.close(savedFds[0])
+            os.close(savedFds[1])
+            sys.argv, sys.path[:] = savedArgv, savedPath
+            unloadModules(savedModules, task['cwd'])
+            os.chdir(savedCwd)
+
+        stdoutFile.seek(0)
+        stderrFile.seek(0)
+        return {
+            "returnCode": returnCode,
+            "stdout": stdoutFile.read().decode(errors='replace'),
+            "stderr": stderrFile.read().decode(errors='replace')
+        }
+
+def main():
+    # the directory of this file is not a part of the environment
+    if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+        sys.path.pop(0)
+
+    # keep the pipes for the protocol, so nothing written by the tasks can reach them
+    requests = os.fdopen(os.dup(0), 'r')
+    responses = os.fdopen(os.dup(1), 'w')
+    devNull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devNull, 0)
+    os.dup2(devNull, 1)
+    os.close(devNull)
+
+    for line in requests:
+        if not line.strip():
+            continue
+        response = runTask(json.loads(line))
+        responses.write(json.dumps(response) + '\n')
+        responses.flush()
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,12 @@ from gamuLogger import Logger, LEVELS
 import sys, os
 from feanorTempDir import TempFile
 import json
+import shlex
+import atexit
 from typing import Callable
 
+from .venvWorker import VenvWorker
+
 
 PYTHON = sys.executable #type: str
 NULL_TARGET = '/dev/null' if os.name == 'posix' else 'nul' #type: str
@@ -23,6 +27,7 @@ class Venv:
         self.__workingDir = workingDir
         self.__debugLevel = debugLevel
         self.__exportFile = exportFileMethod
+        self.__worker = None #type: VenvWorker|None
         
         self.binDir = 'bin' if IS_POSIX else 'Scripts'
         
@@ -65,6 +70,7 @@ class Venv:
         Logger.debug(f"Installing package {package}")
         self.__run(f'python -m pip install {package}')
         Logger.debug(f"Package {package} installed successfully")
+        self.__recycleWorker()
         return self #to chain the calls
         
     def InstallFromRequirements(self, path : str):
@@ -72,6 +78,26 @@ class Venv:
         Logger.debug(f"Installing packages from requirements file {path}")
         self.__run('python', '-m', 'pip', 'install', '-r', path)
         Logger.debug(f"Packages installed successfully")
+        self.__recycleWorker()
+
+    def enableWorker(self, maxTasks : int = 100):
+        """Run the modules in a persistent python process of the virtual environment, instead of starting a new interpreter for each `runModule` call\n
+        Arguments are split like a shell would do, but shell features (redirections, variables, ...) are not available\n
+        Modules imported from the working directory are imported again by each call, other modules stay loaded between calls\n
+        The process is restarted after `maxTasks` modules, after a module failed, and after a package installation\n
+        Return the instance to chain the calls"""
+        if self.__worker is None:
+            Logger.debug(f"Enabling persistent worker (recycled after {maxTasks} tasks)")
+            self.__worker = VenvWorker(self.python, maxTasks)
+            atexit.register(self.__worker.stop)
+        return self
+
+    def stopWorker(self):
+        """Stop the process of the persistent worker, if it is running; it is started again by the next `runModule` call\n
+        Return the instance to chain the calls"""
+        if self.__worker is not None:
+            self.__worker.stop()
+        return self
         
     def runExecutable(self, executable : str, *args : str):
         """Run an executable in the virtual environment\n
@@ -93,7 +119,10 @@ class Venv:
         ```
         """
         Logger.debug(f'Running module "{module}" with arguments {" ".join(args)} in virtual environment (working directory: {self.__workingDir})')
-        self.__run('python', '-m', module, *args)
+        if self.__worker is not None:
+            self.__runInWorker(module, *args)
+        else:
+            self.__run('python', '-m', module, *args)
         Logger.debug(f"Module {module} executed successfully")
         return self
     
@@ -165,5 +194,22 @@ class Venv:
                     Logger.debug('stderr:\n' + file.read())
                     
                 raise RuntimeError('Command failed')
+
+    def __runInWorker(self, module : str, *args : str):
+        # same as the shell would do with `python -m {module} {args}`
+        argv = shlex.split(' '.join((module,) + args), posix=IS_POSIX)
+        Logger.deepDebug(f'running module "{argv[0]}" in worker with arguments {argv[1:]}')
+
+        returnCode, stdout, stderr = self.__worker.runModule(argv[0], argv[1:], self.__workingDir)
+        if returnCode != 0:
+            Logger.error(f'Module "{argv[0]}" failed with return code {returnCode}')
+            Logger.debug('stdout:\n' + stdout)
+            Logger.debug('stderr:\n' + stderr)
+            raise RuntimeError('Command failed')
+
+    def __recycleWorker(self):
+        # installed packages may replace modules already imported by the worker
+        if self.__worker is not None:
+            self.__worker.stop()
         
 #endregion
@@ -0,0 +1,319 @@
+from gamuLogger import Logger
+import os
+import sys
+import re
+import ast
+import time
+import subprocess
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from feanorTempDir.temp import TEMP
+
+from .fileSet import FileIndex, FileSet
+from .stepStats import StepStats
+from .stagingArea import RAM_DIRECTORIES, RAM_DIRECTORY_PATTERN
+
+
+DEPENDENCIES_VARIABLE = 'DEPENDS_ON' #type: str
+WORKSPACE_STATS_FILE = '.feanor-workspace-stats.json' #type: str
+ROOT_PACKAGE_DIST = '_root' #type: str # dist subdirectory of the root package, when the dist directory is shared
+TEMP_DIRECTORY_PATTERN = re.compile(r'[a-z]{10}') #type: re.Pattern # name of the temporary directories created by feanorTempDir
+
+Logger.setModule("Workspace")
+
+class WorkspaceError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+class PackageStatus(Enum):
+    WAITING = 0
+    RUNNING = 1
+    FINISHED = 2
+    FAILED = 3
+    SKIPPED = 4
+
+    def __str__(self):
+        return self.name
+
+class Package:
+    """A package of the workspace, built from its own pack file"""
+    def __init__(self, name : str, packFile : str, dependencies : list[str]):
+        self.name = name
+        self.packFile = packFile
+        self.dependencies = dependencies #type: list[str] # names of the packages that must be built first
+        self.status = PackageStatus.WAITING #type: PackageStatus
+        self.duration = 0.0 #type: float
+        self.output = '' #type: str
+
+    @property
+    def directory(self):
+        """the directory of the pack file, used as base path for the build"""
+        return os.path.dirname(self.packFile)
+
+
+class Workspace:
+    """
+    Build all the packages of a monorepo, each one described by its own pack file\n
+    A pack file can declare the packages it depends on with a module level list, using the name of the package
+    (its directory relative to the workspace root) or the path of its directory relative to the pack file:
+    ```python
+    DEPENDS_ON = ['libs/common', '../utils']
+    ```
+    Packages are built by a shared pool of workers, each package as soon as its dependencies are built;
+    the longest chain of packages is started first, according to the durations recorded by previous runs
+    """
+    def __init__(self, root : str, packFileName : str, args : dict[str, any]):
+        self.__root = os.path.abspath(root)
+        self.__packFileName = packFileName
+        self.__args = args
+        self.__stats = StepStats(self.__root, WORKSPACE_STATS_FILE)
+        self.__packages = {} #type: dict[str, Package]
+
+#region PUBLIC FUNCTIONS
+
+
+    def run(self) -> bool:
+        """Build all the packages of the workspace, return whether all of them succeeded"""
+        self.__discover()
+        if self.__args["plan"]:
+            self.__printPlan()
+            return True
+
+        jobs = self.__args["jobs"] or os.cpu_count() or 1
+        names = list(self.__packages.keys())
+        criticalPaths = self.__stats.criticalPaths(names, self.__getDependencies())
+        Logger.info(f'Building {len(names)} packages with {jobs} workers')
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            running = {}
+            while True:
+                readyPackages = [name for name in names if self.__packages[name].status == PackageStatus.WAITING and self.__canBeStarted(name)]
+                for name in sorted(readyPackages, key=lambda name: criticalPaths[name], reverse=True)[:jobs - len(running)]:
+                    Logger.info(f'Starting package "{name}"')
+                    self.__packages[name].status = PackageStatus.RUNNING
+                    running[pool.submit(self.__build, self.__packages[name])] = name
+                if len(running) == 0:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.__onFinished(running.pop(future), future.result())
+
+        self.__stats.save()
+        return self.__report()
+
+
+#endregion
+#region PRIVATE STATIC FUNCTIONS
+
+
+    @staticmethod
+    def __getCacheDirectory() -> str:
+        # a user cache directory, so the cache is never a part of the workspace files
+        if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
+            return os.path.join(os.environ['LOCALAPPDATA'], 'feanor', 'Cache', 'pip')
+        cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cacheHome, 'feanor', 'pip')
+
+    @staticmethod
+    def __isInside(path : str, directory : str) -> bool:
+        directory = os.path.abspath(directory)
+        return os.path.commonpath([os.path.abspath(path), directory]) == directory
+
+    @staticmethod
+    def __isInTemporaryDirectory(path : str) -> bool:
+        # a temporary directory of a build located in the workspace contains a copy of the pack file
+        for directory, pattern in [(TEMP, TEMP_DIRECTORY_PATTERN)] + [(ramDirectory, RAM_DIRECTORY_PATTERN) for ramDirectory in RAM_DIRECTORIES]:
+            if Workspace.__isInside(path, directory):
+                name = os.path.relpath(os.path.abspath(path), os.path.abspath(directory)).split(os.sep)[0]
+                if pattern.fullmatch(name) and os.path.isdir(os.path.join(directory, name)):
+                    return True
+        return False
+
+
+#endregion
+#region PRIVATE FUNCTIONS
+
+
+    def __discover(self):
+        fileSet = FileSet(FileIndex.getInstance(self.__root), include=[self.__packFileName])
+        for path in fileSet:
+            directory = os.path.dirname(path) or '.'
+            packFile = os.path.join(self.__root, path)
+            self.__packages[directory] = Package(directory, packFile, self.__readDependencies(packFile))
+        # the pack files exported to a dist directory or copied to a temporary directory are not packages
+        distDirs = [self.__getDistDir(package) for package in self.__packages.values()]
+        for name, package in list(self.__packages.items()):
+            if any(Workspace.__isInside(package.packFile, distDir) for distDir in distDirs) or Workspace.__isInTemporaryDirectory(package.packFile):
+                Logger.debug(f'Ignoring {package.packFile}, located in a dist or temporary directory')
+                del self.__packages[name]
+        if len(self.__packages) == 0:
+            raise WorkspaceError(f'No "{self.__packFileName}" found in {self.__root}')
+        Logger.debug('Packages found: ' + ', '.join(self.__packages.keys()))
+
+        for package in self.__packages.values():
+            package.dependencies = [self.__resolveDependency(package, dependency) for dependency in package.dependencies]
+        self.__checkCycles()
+        self.__checkDistDirs()
+
+    def __readDependencies(self, packFile : str) -> list[str]:
+        with open(packFile, 'r') as file:
+            tree = ast.parse(file.read(), packFile)
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == DEPENDENCIES_VARIABLE for target in node.targets):
+                try:
+                    dependencies = ast.literal_eval(node.value)
+                except ValueError as e:
+                    raise WorkspaceError(f'{DEPENDENCIES_VARIABLE} must be a list of strings in {packFile}') from e
+                if not isinstance(dependencies, (list, tuple)) or not all(isinstance(dependency, str) for dependency in dependencies):
+                    raise WorkspaceError(f'{DEPENDENCIES_VARIABLE} must be a list of strings in {packFile}')
+                return list(dependencies)
+        return []
+
+    def __resolveDependency(self, package : Package, dependency : str) -> str:
+        if dependency in self.__packages:
+            return dependency
+        name = os.path.relpath(os.path.normpath(os.path.join(package.directory, dependency)), self.__root).replace(os.sep, '/')
+        if name in self.__packages:
+            return name
+        raise WorkspaceError(f'Package "{package.name}" depends on unknown package "{dependency}"')
+
+    def __checkCycles(self):
+        visited = set()
+        def visit(name : str, chain : list[str]):
+            if name in chain:
+                raise WorkspaceError('Circular dependency between packages: ' + ' -> '.join(chain[chain.index(name):] + [name]))
+            if name in visited:
+                return
+            for dependency in self.__packages[name].dependencies:
+                visit(dependency, chain + [name])
+            visited.add(name)
+        for name in self.__packages:
+            visit(name, [])
+
+    def __checkDistDirs(self):
+        # each package clears its dist directory when it starts, so it must not contain the one of another package
+        distDirs = {name: os.path.abspath(self.__getDistDir(package)) for name, package in self.__packages.items()}
+        for name, distDir in distDirs.items():
+            for other, otherDistDir in distDirs.items():
+                if other != name and os.path.commonpath([distDir, otherDistDir]) == distDir:
+                    raise WorkspaceError(f'The dist directory of package "{name}" ({distDir}) contains the one of package "{other}" ({otherDistDir})')
+
+    def __getDependencies(self) -> dict[str, list[str]]:
+        return {name: package.dependencies for name, package in self.__packages.items()}
+
+    def __getTransitiveDependencies(self, name : str) -> list[str]:
+        result = []
+        for dependency in self.__packages[name].dependencies:
+            for transitive in self.__getTransitiveDependencies(dependency) + [dependency]:
+                if transitive not in result:
+                    result.append(transitive)
+        return result
+
+    def __canBeStarted(self, name : str) -> bool:
+        return all(self.__packages[dependency].status == PackageStatus.FINISHED for dependency in self.__packages[name].dependencies)
+
+    def __onFinished(self, name : str, hasSucceeded : bool):
+        package = self.__packages[name]
+        if hasSucceeded:
+            package.status = PackageStatus.FINISHED
+            self.__stats.record(name, package.duration)
+            Logger.info(f'Package "{name}" built in {package.duration:.2f}s')
+            return
+
+        package.status = PackageStatus.FAILED
+        Logger.error(f'Package "{name}" failed')
+        for line in package.output.splitlines()[-20:]:
+            Logger.error(f'    {line}')
+        # the packages depending on it cannot be built anymore
+        for other in self.__packages.values():
+            if other.status == PackageStatus.WAITING and name in self.__getTransitiveDependencies(other.name):
+                other.status = PackageStatus.SKIPPED
+                Logger.warning(f'Package "{other.name}" skipped because its dependency "{name}" failed')
+
+    def __getDistDir(self, package : Package) -> str:
+        if os.path.isabs(self.__args["dist_dir"]):
+            # each package clears its dist directory, so they cannot share it
+            return os.path.join(self.__args["dist_dir"], ROOT_PACKAGE_DIST if package.name == '.' else package.name)
+        return os.path.join(package.directory, self.__args["dist_dir"])
+
+    def __getEnvironment(self, package : Package) -> dict[str, str]:
+        env = dict(os.environ)
+        # share the pip cache between all the packages, and let them install the packages they depend on
+        env.setdefault('PIP_CACHE_DIR', Workspace.__getCacheDirectory())
+        wheelhouses = [self.__getDistDir(self.__packages[dependency]) for dependency in self.__getTransitiveDependencies(package.name)]
+        if 'PIP_FIND_LINKS' in env:
+            wheelhouses.append(env['PIP_FIND_LINKS'])
+        if len(wheelhouses) > 0:
+            env['PIP_FIND_LINKS'] = ' '.join(wheelhouses)
+        return env
+
+    def __getForwardedArgs(self, package : Package) -> list[str]:
+        forwarded = []
+        for flag in ['debug', 'deep_debug', 'no_tests', 'no_docs', 'no_build', 'publish', 'no_clean']:
+            if self.__args[flag]:
+                forwarded.append('--' + flag.replace('_', '-'))
+        forwarded += ['--dist-dir', self.__getDistDir(package)]
+        forwarded += ['--package-version', self.__args["package_version"]]
+        forwarded += ['--temp-backend', self.__args["temp_backend"]]
+        return forwarded
+
+    def __build(self, package : Package) -> bool:
+        command = [sys.executable, '-m', 'feanor', package.packFile] + self.__getForwardedArgs(package)
+        Logger.deepDebug(f'executing command: "{" ".join(command)}" in {package.directory}')
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(command, cwd=package.directory, env=self.__getEnvironment(package), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        except Exception as e:
+            # only this package fails, the other ones keep being built
+            package.duration = time.perf_counter() - start
+            package.output = f'Could not start the build: {str(e)}'
+            return False
+        package.duration = time.perf_counter() - start
+        package.output = result.stdout
+        return result.returncode == 0
+
+    def __printPlan(self):
+        jobs = self.__args["jobs"] or os.cpu_count() or 1
+        names = list(self.__packages.keys())
+        dependencies = self.__getDependencies()
+        paths = self.__stats.criticalPaths(names, dependencies)
+
+        lines = ["planned packages (longest remaining path first):"]
+        for name in sorted(names, key=lambda name: paths[name], reverse=True):
+            duration = f'{self.__stats.getDuration(name):.2f}s' if self.__stats.hasDuration(name) else 'no history'
+            after = f', after {", ".join(dependencies[name])}' if len(dependencies[name]) > 0 else ''
+            lines.append(f'{name} ({duration}, remaining path: {paths[name]:.2f}s{after})')
+        Logger.info("\n\t".join(lines))
+
+        criticalPath = self.__stats.criticalPath(names, dependencies)
+        criticalTime = sum(self.__stats.getDuration(name) for name in criticalPath)
+        # the build cannot be shorter than its critical path, nor than the work shared between the workers
+        total = max(criticalTime, sum(self.__stats.getDuration(name) for name in names) / jobs)
+        Logger.info(f'predicted critical path: {" -> ".join(criticalPath)} ({criticalTime:.2f}s)')
+        Logger.info(f'predicted total time: at least {total:.2f}s with {jobs} workers')
+
+    def __report(self) -> bool:
+        lines = ["workspace report:"]
+        for name, package in self.__packages.items():
+            line = f'{name}: {str(package.status)}'
+            if package.status in [PackageStatus.FINISHED, PackageStatus.FAILED]:
+                line += f' ({package.duration:.2f}s)'
+            lines.append(line)
+            distDir = self.__getDistDir(package)
+            if package.status == PackageStatus.FINISHED and os.path.isdir(distDir):
+                for root, _, filenames in os.walk(distDir):
+                    for filename in filenames:
+                        lines.append('    ' + os.path.relpath(os.path.join(root, filename), self.__root))
+        hasSucceeded = all(package.status == PackageStatus.FINISHED for package in self.__packages.values())
+        if hasSucceeded:
+            Logger.info("\n\t".join(lines))
+        else:
+            Logger.error("\n\t".join(lines))
+        return hasSucceeded
+
+#endregion